@@ -12,14 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+import asyncio
+import hashlib
 import os
+import time
 from contextlib import asynccontextmanager
 from typing import Any, Optional
 
+import orjson
 import uvicorn
 from fastapi import APIRouter, Body, FastAPI, HTTPException, Request
-from fastapi.responses import PlainTextResponse, RedirectResponse
+from fastapi.responses import (
+    HTMLResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from google.auth.transport import requests  # type:ignore
@@ -31,6 +39,20 @@ from orchestrator import createOrchestrator
 
 routes = APIRouter()
 templates = Jinja2Templates(directory="templates")
+# Reuse one transport so Google's public certs are fetched over a kept-alive
+# connection
+AUTH_REQUEST = requests.Request()
+# Verified user info keyed by a hash of the ID token, kept until shortly
+# before the token expires
+VERIFIED_USER_INFO: dict[str, tuple[dict[str, str], float]] = {}
+VERIFIED_USER_INFO_EXPIRY_SKEW = 30
+VERIFIED_USER_INFO_MAXSIZE = 1024
+# Signed-in users' ID tokens and their expiry, keyed by session uuid. Kept
+# server side and apart from the orchestrator's user sessions, so a user
+# session evicted while idle can be restored without the token ever being
+# written to the cookie session.
+USER_ID_TOKENS: dict[str, tuple[str, float]] = {}
+USER_ID_TOKENS_MAXSIZE = 10000
 
 
 @asynccontextmanager
@@ -50,38 +72,48 @@ async def index(request: Request):
     orchestrator = request.app.state.orchestrator
     session = request.session
 
+    uuid = await ensure_user_session(request)
+
     # check if token and user info is still valid
-    if "uuid" in session:
-        user_id_token = orchestrator.get_user_id_token(session["uuid"])
-        if user_id_token:
-            if session.get("user_info") and not get_user_info(
-                user_id_token, request.app.state.client_id
-            ):
-                await logout_google(request)
-        elif not user_id_token and "user_info" in session:
+    user_id_token = orchestrator.get_user_id_token(uuid)
+    if user_id_token:
+        # Verified tokens are cached until they expire, so this only
+        # verifies the token again once it is no longer valid
+        if session.get("user_info") and not get_user_info(
+            user_id_token, request.app.state.client_id
+        ):
             await logout_google(request)
-
-    if "uuid" not in session or not orchestrator.user_session_exist(session["uuid"]):
-        await orchestrator.user_session_create(session)
-
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "messages": request.session["history"],
-            "client_id": request.app.state.client_id,
-            "user_img": (
-                request.session["user_info"]["user_img"]
-                if "user_info" in request.session
-                else None
-            ),
-            "user_name": (
-                request.session["user_info"]["name"]
-                if "user_info" in request.session
-                else None
-            ),
-        },
-    )
+    elif "user_info" in session:
+        await logout_google(request)
+
+    if "uuid" not in session:
+        # Logging out cleared the session, start a new one
+        await ensure_user_session(request)
+
+    user_info = session.get("user_info", {})
+    context = {
+        "messages": session["history"],
+        "client_id": request.app.state.client_id,
+        "user_img": user_info.get("user_img"),
+        "user_name": user_info.get("name"),
+    }
+    # The page only depends on the template and the context above, so let the
+    # browser revalidate its cached copy instead of rendering it again
+    etag = get_index_etag(request.app.state.index_template_digest, context)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.method == "GET":
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+
+    content = request.app.state.index_template.render({"request": request, **context})
+    return HTMLResponse(content, headers=headers)
+
+
+def get_index_etag(template_digest: str, context: dict[str, Any]) -> str:
+    digest = hashlib.blake2b(template_digest.encode(), digest_size=16)
+    digest.update(orjson.dumps(context, default=str))
+    return f'W/"{digest.hexdigest()}"'
 
 
 @routes.post("/login/google", response_class=RedirectResponse)
@@ -98,24 +130,27 @@ async def login_google(
         raise HTTPException(status_code=400, detail="Client id not found")
 
     session = request.session
-    user_info = get_user_info(str(user_id_token), client_id)
+    verified = verify_user_id_token(str(user_id_token), client_id)
+    user_info = verified[0] if verified else {}
     session["user_info"] = user_info
 
     # create new request session
     orchestrator = request.app.state.orchestrator
-    orchestrator.set_user_session_header(session["uuid"], str(user_id_token))
+    uuid = await ensure_user_session(request)
+    if verified:
+        save_user_id_token(uuid, str(user_id_token), verified[1])
+    orchestrator.set_user_session_header(uuid, str(user_id_token))
     print("Logged in to Google.")
 
-    welcome_text = (
-        f"Welcome to Cymbal Air, {session['user_info']['name']}! How may I assist you?"
-    )
-    if len(request.session["history"]) == 1:
-        session["history"][0] = {
+    welcome_text = f"Welcome to Cymbal Air, {user_info['name']}! How may I assist you?"
+    history = session["history"]
+    if len(history) == 1:
+        history[0] = {
             "type": "ai",
             "data": {"content": welcome_text},
         }
     else:
-        session["history"].append({"type": "ai", "data": {"content": welcome_text}})
+        history.append({"type": "ai", "data": {"content": welcome_text}})
 
     # Redirect to source URL
     source_url = request.headers["Referer"]
@@ -131,6 +166,7 @@ async def logout_google(
         raise HTTPException(status_code=400, detail="No session to reset.")
 
     uuid = request.session["uuid"]
+    USER_ID_TOKENS.pop(uuid, None)
     orchestrator = request.app.state.orchestrator
     if orchestrator.user_session_exist(uuid):
         await orchestrator.user_session_signout(uuid)
@@ -143,28 +179,32 @@ async def chat_handler(request: Request, prompt: str = Body(embed=True)):
     # Retrieve user prompt
     if not prompt:
         raise HTTPException(status_code=400, detail="Error: No user query")
-    if "uuid" not in request.session:
+    session = request.session
+    if "uuid" not in session:
         raise HTTPException(
             status_code=400, detail="Error: Invoke index handler before start chatting"
         )
 
-    # Add user message to chat history
-    request.session["history"].append({"type": "human", "data": {"content": prompt}})
     orchestrator = request.app.state.orchestrator
-    response = await orchestrator.user_session_invoke(request.session["uuid"], prompt)
+    uuid = await ensure_user_session(request)
+
+    # Add user message to chat history
+    history = session["history"]
+    history.append({"type": "human", "data": {"content": prompt}})
+    response = await orchestrator.user_session_invoke(uuid, prompt)
     output = response.get("output")
     confirmation = response.get("confirmation")
     trace = response.get("trace")
     # Return assistant response
     if confirmation:
-        return json.dumps(
-            {"type": "confirmation", "content": confirmation, "trace": trace}
-        )
+        content = {"type": "confirmation", "content": confirmation, "trace": trace}
+        return PlainTextResponse(orjson.dumps(content, default=str))
     else:
-        request.session["history"].append({"type": "ai", "data": {"content": output}})
-        return json.dumps(
-            {"type": "message", "content": markdown(output), "trace": trace}
-        )
+        history.append({"type": "ai", "data": {"content": output}})
+        # Markdown rendering is pure Python, keep it off the event loop
+        html = await asyncio.to_thread(markdown, output)
+        content = {"type": "message", "content": html, "trace": trace}
+        return PlainTextResponse(orjson.dumps(content, default=str))
 
 
 @routes.post("/book/flight", response_class=PlainTextResponse)
@@ -178,9 +218,8 @@ async def book_flight(request: Request, params: str = Body(embed=True)):
             status_code=400, detail="Error: Invoke index handler before start chatting"
         )
     orchestrator = request.app.state.orchestrator
-    response = await orchestrator.user_session_insert_ticket(
-        request.session["uuid"], params
-    )
+    uuid = await ensure_user_session(request)
+    response = await orchestrator.user_session_insert_ticket(uuid, params)
     # Note in the history, that the ticket has been successfully booked
     request.session["history"].append(
         {"type": "ai", "data": {"content": "I have booked your ticket."}}
@@ -193,8 +232,13 @@ async def decline_flight(request: Request):
     """Handler for LangChain chat requests"""
     # Note in the history, that the ticket was not booked
     # This is helpful in case of reloads so there doesn't seem to be a break in communication.
+    if "uuid" not in request.session:
+        raise HTTPException(
+            status_code=400, detail="Error: Invoke index handler before start chatting"
+        )
     orchestrator = request.app.state.orchestrator
-    response = await orchestrator.user_session_decline_ticket(request.session["uuid"])
+    uuid = await ensure_user_session(request)
+    response = await orchestrator.user_session_decline_ticket(uuid)
     request.session["history"].append(
         {"type": "ai", "data": {"content": "Please confirm if you would like to book."}}
     )
@@ -205,31 +249,86 @@ async def decline_flight(request: Request):
 
 
 @routes.post("/reset")
-def reset(request: Request):
+async def reset(request: Request):
     """Reset user session"""
 
     if "uuid" not in request.session:
         raise HTTPException(status_code=400, detail="No session to reset.")
 
-    uuid = request.session["uuid"]
     orchestrator = request.app.state.orchestrator
-    if not orchestrator.user_session_exist(uuid):
-        raise HTTPException(status_code=500, detail="Current user session not found")
-
+    uuid = await ensure_user_session(request)
     orchestrator.user_session_reset(request.session, uuid)
 
 
+async def ensure_user_session(request: Request) -> str:
+    """Create the orchestrator user session if it does not exist."""
+    session = request.session
+    orchestrator = request.app.state.orchestrator
+    if "uuid" in session and orchestrator.user_session_exist(session["uuid"]):
+        return session["uuid"]
+    # New, or evicted while idle. Restore the user session from the history
+    # in the cookie session and the user's ID token, if still valid.
+    await orchestrator.user_session_create(session)
+    user_id_token = load_user_id_token(session["uuid"])
+    if user_id_token:
+        orchestrator.set_user_session_header(session["uuid"], user_id_token)
+    return session["uuid"]
+
+
+def save_user_id_token(uuid: str, user_id_token: str, expiry: float):
+    USER_ID_TOKENS.pop(uuid, None)
+    if len(USER_ID_TOKENS) >= USER_ID_TOKENS_MAXSIZE:
+        # Drop the oldest entry
+        del USER_ID_TOKENS[next(iter(USER_ID_TOKENS))]
+    USER_ID_TOKENS[uuid] = (user_id_token, expiry)
+
+
+def load_user_id_token(uuid: str) -> Optional[str]:
+    cached = USER_ID_TOKENS.get(uuid)
+    if cached is None:
+        return None
+    user_id_token, expiry = cached
+    if time.time() >= expiry:
+        del USER_ID_TOKENS[uuid]
+        return None
+    return user_id_token
+
+
 def get_user_info(user_id_token: str, client_id: str) -> dict[str, str]:
+    verified = verify_user_id_token(user_id_token, client_id)
+    return verified[0] if verified else {}
+
+
+def verify_user_id_token(
+    user_id_token: str, client_id: str
+) -> Optional[tuple[dict[str, str], float]]:
+    """Return the user info and expiry of a valid ID token, None otherwise."""
+    # Avoid keeping the raw token around as a cache key
+    key = hashlib.blake2b(
+        f"{client_id}:{user_id_token}".encode(), digest_size=16
+    ).hexdigest()
+    cached = VERIFIED_USER_INFO.get(key)
+    if cached is not None:
+        if time.time() < cached[1] - VERIFIED_USER_INFO_EXPIRY_SKEW:
+            return cached
+        del VERIFIED_USER_INFO[key]
+
     try:
         id_info = id_token.verify_oauth2_token(
-            user_id_token, requests.Request(), audience=client_id
+            user_id_token, AUTH_REQUEST, audience=client_id
         )
-        return {
-            "user_img": id_info["picture"],
-            "name": id_info["name"],
-        }
     except ValueError as err:
-        return {}
+        return None
+    user_info = {
+        "user_img": id_info["picture"],
+        "name": id_info["name"],
+    }
+    if len(VERIFIED_USER_INFO) >= VERIFIED_USER_INFO_MAXSIZE:
+        # Drop the oldest entry
+        del VERIFIED_USER_INFO[next(iter(VERIFIED_USER_INFO))]
+    verified = (user_info, id_info["exp"])
+    VERIFIED_USER_INFO[key] = verified
+    return verified
 
 
 def clear_user_info(session: dict[str, Any]):
@@ -247,6 +346,12 @@ def init_app(
     app = FastAPI(lifespan=lifespan)
     app.state.client_id = client_id
     app.state.orchestrator = createOrchestrator(orchestration_type)
+    # Load the index template once instead of looking it up on every request
+    app.state.index_template = templates.get_template("index.html")
+    with open(app.state.index_template.filename, "rb") as f:
+        app.state.index_template_digest = hashlib.blake2b(
+            f.read(), digest_size=16
+        ).hexdigest()
     app.include_router(routes)
     app.mount("/static", StaticFiles(directory="static"), name="static")
     app.add_middleware(SessionMiddleware, secret_key=middleware_secret)
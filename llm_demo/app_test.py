@@ -12,6 +12,120 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import get_index_etag, init_app
+
+BASE_HISTORY = {
+    "type": "ai",
+    "data": {"content": "Welcome to Cymbal Air!  How may I assist you?"},
+}
+
 
 def test_empty():
     pass
+
+
+@pytest.fixture
+def client(monkeypatch, orchestrator):
+    # The app loads its templates and static files relative to its directory
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.setattr("app.createOrchestrator", lambda _: orchestrator)
+    monkeypatch.setattr("app.USER_ID_TOKENS", {})
+    app = init_app("fake", client_id="client id", middleware_secret="secret")
+    with TestClient(app) as client:
+        yield client
+
+
+def test_index_returns_not_modified_for_matching_etag(client):
+    response = client.get("/")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_index_etag_changes_with_history(client):
+    etag = client.get("/").headers["ETag"]
+    response = client.post("/chat", json={"prompt": "Hello"})
+    assert response.status_code == 200
+
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_get_index_etag_changes_with_context():
+    context = {
+        "messages": [BASE_HISTORY],
+        "client_id": "client id",
+        "user_img": None,
+        "user_name": None,
+    }
+    etag = get_index_etag("digest", context)
+
+    assert get_index_etag("digest", dict(context)) == etag
+    history = [BASE_HISTORY, {"type": "human", "data": {"content": "Hello"}}]
+    assert get_index_etag("digest", {**context, "messages": history}) != etag
+    user_info = {"user_img": "https://example.com/user.png", "user_name": "Alex"}
+    assert get_index_etag("digest", {**context, **user_info}) != etag
+    assert get_index_etag("other digest", context) != etag
+
+
+def login(client, monkeypatch, expiry: float):
+    user_info = {"user_img": "https://example.com/user.png", "name": "Alex"}
+    verified = (user_info, expiry)
+    monkeypatch.setattr("app.verify_user_id_token", lambda *_: verified)
+    client.get("/")
+    response = client.post(
+        "/login/google",
+        data={"credential": "user id token"},
+        headers={"Referer": "http://testserver/"},
+        follow_redirects=False,
+    )
+    assert response.status_code == 307
+
+
+def test_evicted_user_session_is_restored(client, orchestrator, monkeypatch):
+    login(client, monkeypatch, expiry=time.time() + 3600)
+
+    for method, url, body in [
+        ("POST", "/chat", {"prompt": "Hello"}),
+        ("POST", "/book/flight", {"params": "{}"}),
+        ("POST", "/book/flight/decline", None),
+        ("POST", "/reset", None),
+        ("GET", "/", None),
+    ]:
+        # Evict the user session, as the orchestrator does for idle sessions
+        orchestrator.sessions.clear()
+        response = client.request(method, url, json=body)
+        assert response.status_code == 200, url
+        # The user session is recreated and stays signed in
+        user_id_tokens = [s.user_id_token for s in orchestrator.sessions.values()]
+        assert user_id_tokens == ["user id token"], url
+
+    assert "Alex" in response.text
+    # The ID token is kept server side, never in the cookie session
+    cookie = client.cookies["session"].split(".")[0]
+    assert b"user id token" not in base64.b64decode(cookie)
+
+
+def test_evicted_user_session_with_expired_token_is_signed_out(
+    client, orchestrator, monkeypatch
+):
+    login(client, monkeypatch, expiry=time.time() - 1)
+    orchestrator.sessions.clear()
+
+    response = client.get("/")
+
+    assert response.status_code == 200
+    assert "Alex" not in response.text
+    assert [s.user_id_token for s in orchestrator.sessions.values()] == [None]
@@ -0,0 +1,96 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import copy
+import uuid as uuid_lib
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+BASE_HISTORY = {
+    "type": "ai",
+    "data": {"content": "Welcome to Cymbal Air!  How may I assist you?"},
+}
+
+
+class FakeAgent:
+    def __init__(self, uuid: str, session: Dict[str, Any]):
+        self.uuid = uuid
+        # The session the agent was created from
+        self.session = session
+        self.queries: List[str] = []
+        self.user_id_token: Optional[str] = None
+
+    async def invoke(self, prompt: str) -> Dict[str, Any]:
+        self.queries.append(prompt)
+        # Let other requests run in between
+        await asyncio.sleep(0)
+        return {"output": f"{self.uuid}: {prompt}", "intermediate_steps": []}
+
+
+class FakeOrchestrator:
+    """In-memory orchestrator that echoes prompts instead of calling an LLM."""
+
+    def __init__(self):
+        self.sessions: Dict[str, FakeAgent] = {}
+        self.resets: List[str] = []
+        self.signed_out: List[FakeAgent] = []
+
+    def user_session_exist(self, uuid: str) -> bool:
+        return uuid in self.sessions
+
+    async def user_session_create(self, session: Dict[str, Any]):
+        if "uuid" not in session:
+            session["uuid"] = str(uuid_lib.uuid4())
+        if "history" not in session:
+            session["history"] = [BASE_HISTORY]
+        uuid = session["uuid"]
+        self.sessions[uuid] = FakeAgent(uuid, copy.deepcopy(session))
+
+    async def user_session_invoke(self, uuid: str, prompt: str) -> Dict[str, Any]:
+        response = await self.sessions[uuid].invoke(prompt)
+        return {"output": response["output"]}
+
+    async def user_session_insert_ticket(self, uuid: str, params: str) -> Any:
+        return f"Booked for {self.sessions[uuid].user_id_token}"
+
+    async def user_session_decline_ticket(self, uuid: str) -> None:
+        return None
+
+    def get_user_session(self, uuid: str) -> FakeAgent:
+        return self.sessions[uuid]
+
+    def user_session_reset(self, session: Dict[str, Any], uuid: str):
+        self.resets.append(uuid)
+        session["history"] = [BASE_HISTORY]
+
+    async def user_session_signout(self, uuid: str):
+        self.signed_out.append(self.sessions.pop(uuid))
+
+    def set_user_session_header(self, uuid: str, user_id_token: str):
+        self.sessions[uuid].user_id_token = user_id_token
+
+    def get_user_id_token(self, uuid: str) -> Optional[str]:
+        if uuid in self.sessions:
+            return self.sessions[uuid].user_id_token
+        return None
+
+    async def close_clients(self):
+        self.sessions.clear()
+
+
+@pytest.fixture
+def orchestrator() -> FakeOrchestrator:
+    return FakeOrchestrator()
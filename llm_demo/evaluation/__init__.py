@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .eval_golden import goldens
+from .eval_golden import get_goldens
 from .evaluation import (
     evaluate_response_phase,
     evaluate_retrieval_phase,
@@ -21,7 +21,7 @@ from .evaluation import (
 
 __ALL__ = [
     "run_llm_for_eval",
-    "goldens",
+    "get_goldens",
     "evaluate_retrieval_phase",
     "evaluate_response_phase",
 ]
@@ -13,9 +13,12 @@
 # limitations under the License.
 
 import asyncio
-import json
+import copy
+import logging
+import os
 from typing import Dict, List
 
+import orjson
 import pandas as pd
 from pydantic import BaseModel, Field
 from vertexai.evaluation import EvalTask
@@ -26,6 +29,11 @@ from orchestrator import BaseOrchestrator
 from .eval_golden import EvalData, ToolCall
 from .metrics import response_phase_metrics, retrieval_phase_metrics
 
+logger = logging.getLogger(__name__)
+
+# Number of independent golden query groups to run at the same time
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", default=8))
+
 
 async def run_llm_for_eval(
     eval_list: List[EvalData], orc: BaseOrchestrator, session: Dict, session_id: str
@@ -33,37 +41,72 @@ async def run_llm_for_eval(
     """
     Generate llm_tool_calls and llm_output for golden dataset query.
     This function is only compatible with the langchain-tools orchestration.
+    Queries up to the next chat reset depend on each other and run in order,
+    each such group runs concurrently in its own user session.
     """
+    user_id_token = orc.get_user_id_token(session_id)
+    # Every group starts from the caller's session as it is now, so they share
+    # its base history and signed-in user
+    base_session = copy.deepcopy(session)
+    semaphore = asyncio.Semaphore(EVAL_CONCURRENCY)
+
+    async def run_group(index: int, group: List[EvalData]):
+        async with semaphore:
+            if index == 0:
+                await run_llm_for_eval_group(group, orc, session, session_id)
+                return
+            group_session_id = f"{session_id}-{index}"
+            group_session = copy.deepcopy(base_session)
+            group_session["uuid"] = group_session_id
+            await orc.user_session_create(group_session)
+            if user_id_token:
+                orc.set_user_session_header(group_session_id, user_id_token)
+            try:
+                await run_llm_for_eval_group(
+                    group, orc, group_session, group_session_id
+                )
+            finally:
+                await orc.user_session_signout(group_session_id)
+
+    groups: List[List[EvalData]] = [[]]
+    for eval_data in eval_list:
+        groups[-1].append(eval_data)
+        if eval_data.reset:
+            groups.append([])
+    await asyncio.gather(
+        *(run_group(index, group) for index, group in enumerate(groups) if group)
+    )
+    return eval_list
+
+
+async def run_llm_for_eval_group(
+    eval_list: List[EvalData], orc: BaseOrchestrator, session: Dict, session_id: str
+):
     agent = orc.get_user_session(session_id)
     for eval_data in eval_list:
         try:
             query_response = await agent.invoke(eval_data.query)
-        except Exception as e:
-            print(f"error invoking agent: {e}")
+            # Retrieve llm_tool_calls and their outputs from query response
+            steps = query_response.get("intermediate_steps") or []
+            # The agent's tool inputs are not under our control, so validate
+            # them here instead of failing later when they are serialized
+            llm_tool_calls = [
+                ToolCall(name=step[0].tool, arguments=step[0].tool_input)
+                for step in steps
+            ]
+        except Exception:
+            logger.warning(
+                "error running agent for query %r", eval_data.query, exc_info=True
+            )
         else:
             eval_data.llm_output = query_response.get("output")
-
-            # Retrieve llm_tool_calls from query response
-            llm_tool_calls = []
-            contexts = []
-            for step in query_response.get("intermediate_steps"):
-                called_tool = step[0]
-                tool_call = ToolCall(
-                    name=called_tool.tool,
-                    arguments=called_tool.tool_input,
-                )
-                llm_tool_calls.append(tool_call)
-                context = step[-1]
-                contexts.append(context)
-
             eval_data.llm_tool_calls = llm_tool_calls
-            eval_data.context = contexts
+            eval_data.context = [step[-1] for step in steps]
             eval_data.prompt = PROMPT
             eval_data.instruction = f"Answer user query based on context given. User query is {eval_data.query}."
 
         if eval_data.reset:
             orc.user_session_reset(session, session_id)
-    return eval_list
 
 
 def evaluate_retrieval_phase(
@@ -73,25 +116,17 @@ def evaluate_retrieval_phase(
     Run evaluation for the ability of a model to select the right tool and arguments (retrieval phase).
     """
     # Prepare evaluation task input
-    responses = []
-    references = []
-    for e in eval_datas:
-        references.append(
-            json.dumps(
-                {
-                    "content": e.content,
-                    "tool_calls": [t.model_dump() for t in e.tool_calls],
-                }
-            )
-        )
-        responses.append(
-            json.dumps(
-                {
-                    "content": e.content,
-                    "tool_calls": [t.model_dump() for t in e.llm_tool_calls],
-                }
-            )
-        )
+    references = [e.reference_json for e in eval_datas]
+    responses = [
+        orjson.dumps(
+            {
+                "content": e.content,
+                "tool_calls": [t.as_dict for t in e.llm_tool_calls],
+            },
+            default=str,
+        ).decode()
+        for e in eval_datas
+    ]
     eval_dataset = pd.DataFrame(
         {
             "response": responses,
@@ -122,10 +157,12 @@ def evaluate_response_phase(
     for e in eval_datas:
         instructions.append(e.instruction)
         context_str = (
-            [json.dumps(c) for c in e.context] if e.context else ["no data retrieved"]
+            orjson.dumps(e.context, default=str).decode()
+            if e.context
+            else "no data retrieved"
         )
         prompts.append(e.prompt)
-        contexts.append(", ".join(context_str))
+        contexts.append(context_str)
         responses.append(e.llm_output or "")
     eval_dataset = pd.DataFrame(
         {
@@ -0,0 +1,53 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from .eval_golden import EvalData
+from .evaluation import run_llm_for_eval
+
+
+@pytest.mark.asyncio
+async def test_run_llm_for_eval_groups_queries_by_reset(orchestrator):
+    orc = orchestrator
+    user_info = {"user_img": "https://example.com/user.png", "name": "Alex"}
+    session = {"uuid": "session", "user_info": user_info}
+    await orc.user_session_create(session)
+    orc.set_user_session_header("session", "user id token")
+    # Queries up to each reset form a group: [a, b], [c], [d, e]
+    resets = {"a": False, "b": True, "c": True, "d": False, "e": True}
+    eval_list = [EvalData(query=query, reset=reset) for query, reset in resets.items()]
+
+    result = await run_llm_for_eval(eval_list, orc, session, "session")
+
+    assert result is eval_list
+    assert [e.llm_output for e in result] == [
+        "session: a",
+        "session: b",
+        "session-1: c",
+        "session-2: d",
+        "session-2: e",
+    ]
+    # Group 0 runs in the caller's session, which is kept
+    assert orc.sessions["session"].queries == ["a", "b"]
+    # The other groups run in their own sessions, signed out afterwards
+    signed_out = {s.uuid: s for s in orc.signed_out}
+    assert sorted(signed_out) == ["session-1", "session-2"]
+    assert list(orc.sessions) == ["session"]
+    # Group sessions start from the caller's history, user and ID token
+    for group_session in signed_out.values():
+        assert group_session.session["history"] == session["history"]
+        assert group_session.session["user_info"] == user_info
+        assert group_session.user_id_token == "user id token"
+    assert sorted(orc.resets) == ["session", "session-1", "session-2"]
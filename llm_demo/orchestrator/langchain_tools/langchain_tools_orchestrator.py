@@ -12,18 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import asyncio
 import os
+import time
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Type
 
 from aiohttp import ClientSession, TCPConnector
 from fastapi import HTTPException
 from langchain.agents import AgentType, initialize_agent
 from langchain.agents.agent import AgentExecutor
 from langchain.globals import set_verbose  # type: ignore
-from langchain.memory import ConversationBufferMemory
+from langchain.memory import ConversationBufferWindowMemory
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
@@ -32,7 +33,10 @@ from langchain_google_vertexai import ChatVertexAI
 from pytz import timezone
 
 from ..orchestrator import BaseOrchestrator, classproperty
+from ..retrieval_client import create_connector
 from .tools import (
+    CLIENT,
+    USER_ID_TOKEN,
     get_confirmation_needing_tools,
     initialize_tools,
     insert_ticket,
@@ -44,21 +48,75 @@ BASE_HISTORY = {
     "type": "ai",
     "data": {"content": "Welcome to Cymbal Air!  How may I assist you?"},
 }
+# Idle user sessions are dropped after this many seconds, or once there are too
+# many of them, starting with the least recently used
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", default=1000))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", default=3600))
+# Number of most recent conversation turns included in the prompt
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", default=8))
+MESSAGE_TYPES: Dict[str, Type[BaseMessage]] = {
+    "human": HumanMessage,
+    "ai": AIMessage,
+}
+BASE_HISTORY_MESSAGE = AIMessage(content=BASE_HISTORY["data"]["content"])
+PACIFIC_TIMEZONE = timezone("US/Pacific")
+DATETIME_FORMATTER = "%A, %m/%d/%Y, %H:%M:%S"
+# Last formatted datetime and the unix second it was formatted for
+CURRENT_DATETIME: Tuple[int, str] = (-1, "")
+
+
+def build_prompt_template(
+    tool_signature: Tuple[Tuple[str, str], ...],
+) -> ChatPromptTemplate:
+    # Create new prompt template
+    tool_strings = "\n".join(
+        [f"> {name}: {description}" for name, description in tool_signature]
+    )
+    tool_names = ", ".join([name for name, _ in tool_signature])
+    format_instructions = FORMAT_INSTRUCTIONS.format(
+        tool_names=tool_names,
+    )
+    template = "\n\n".join(
+        [
+            PREFIX,
+            TOOLS_PREFIX,
+            tool_strings,
+            format_instructions,
+            SUFFIX,
+        ]
+    )
+    # Keep the changing datetime out of the system message, so that its long
+    # static prefix stays byte-identical across turns for prompt caching
+    current_datetime = "Today's date and current time is {cur_datetime}."
+    human_message_template = "\n\n".join(
+        [current_datetime, "{input}", "{agent_scratchpad}"]
+    )
+
+    return ChatPromptTemplate.from_messages(
+        [("system", template), ("human", human_message_template)]
+    )
 
 
 class UserAgent:
     client: ClientSession
     agent: AgentExecutor
+    user_id_token: Optional[str] = None
+    # Waiting for the user to confirm or decline a booking
+    pending_confirmation: bool = False
+    # Calls currently running on behalf of this user, which keep it from
+    # being evicted
+    active_calls: int = 0
 
     def __init__(
         self,
         client: ClientSession,
         agent: AgentExecutor,
-        memory: ConversationBufferMemory,
+        memory: ConversationBufferWindowMemory,
     ):
         self.client = client
         self.agent = agent
         self.memory = memory
+        self.last_used = time.monotonic()
 
     @classmethod
     def initialize_agent(
@@ -67,11 +125,11 @@ class UserAgent:
         tools: List[StructuredTool],
         history: List[BaseMessage],
         prompt: ChatPromptTemplate,
-        model: str,
+        llm: ChatVertexAI,
     ) -> "UserAgent":
         # TODO: Use .bind_tools(tools) to bind the tools with the LLM.
-        llm = ChatVertexAI(max_output_tokens=512, model_name=model, temperature=0.0)
-        memory = ConversationBufferMemory(
+        memory = ConversationBufferWindowMemory(
+            k=CHAT_HISTORY_WINDOW,
             chat_memory=ChatMessageHistory(messages=history),
             memory_key="chat_history",
             input_key="input",
@@ -90,31 +148,51 @@ class UserAgent:
         agent.agent.llm_chain.prompt = prompt  # type: ignore
         return UserAgent(client, agent, memory)
 
-    async def close(self):
-        await self.client.close()
+    @contextmanager
+    def in_use(self):
+        self.active_calls += 1
+        try:
+            yield self
+        finally:
+            self.active_calls -= 1
 
     async def invoke(self, prompt: str) -> Dict[str, Any]:
+        # Route the shared tools' requests through the shared session on behalf
+        # of this user
+        client_token = CLIENT.set(self.client)
+        user_id_token = USER_ID_TOKEN.set(self.user_id_token)
         try:
-            response = await self.agent.ainvoke({"input": prompt})
+            with self.in_use():
+                response = await self.agent.ainvoke({"input": prompt})
         except Exception as err:
             raise HTTPException(status_code=500, detail=f"Error invoking agent: {err}")
+        finally:
+            USER_ID_TOKEN.reset(user_id_token)
+            CLIENT.reset(client_token)
         return response
 
     async def insert_ticket(self, params: str):
-        return await insert_ticket(self.client, params)
+        with self.in_use():
+            return await insert_ticket(self.client, params, self.user_id_token)
 
     def reset_memory(self, base_message: List[BaseMessage]):
-        self.memory.clear()
-        self.memory.chat_memory = ChatMessageHistory(messages=base_message)
+        messages = self.memory.chat_memory.messages
+        messages.clear()
+        messages.extend(base_message)
 
 
 class LangChainToolsOrchestrator(BaseOrchestrator):
     _user_sessions: Dict[str, UserAgent]
+    # Prompt templates bound to this orchestrator, keyed by tool signature
+    _prompts: Dict[Tuple[Tuple[str, str], ...], ChatPromptTemplate]
     # aiohttp context
     connector = None
+    client: Optional[ClientSession] = None
+    llm: Optional[ChatVertexAI] = None
 
     def __init__(self):
         self._user_sessions = {}
+        self._prompts = {}
 
     @classproperty
     def kind(cls):
@@ -125,6 +203,7 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
 
     async def user_session_insert_ticket(self, uuid: str, params: str) -> Any:
         user_session = self.get_user_session(uuid)
+        user_session.pending_confirmation = False
         response = await user_session.insert_ticket(params)
         return response
 
@@ -133,19 +212,25 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
         Used if there's a process to be done after user decline ticket.
         Return None is nothing is needed to be done.
         """
+        self.get_user_session(uuid).pending_confirmation = False
         return None
 
-    async def check_and_add_confirmations(self, response: Dict[str, Any]):
+    async def check_and_add_confirmations(
+        self, user_session: UserAgent, response: Dict[str, Any]
+    ):
+        confirmation_needing_tools = self.confirmation_needing_tools
         for step in response.get("intermediate_steps") or []:
             if len(step) > 0:
                 # Find the called tool in the step
                 called_tool = step[0]
                 # Check to see if the agent has made a decision to call Prepare Insert Ticket
                 # This tool is a no-op and requires user confirmation before continuing
-                if called_tool.tool in self.confirmation_needing_tools:
+                if called_tool.tool in confirmation_needing_tools:
                     if called_tool.tool == "Insert Ticket":
                         flight_info = await validate_ticket(
-                            self.client, called_tool.tool_input
+                            user_session.client,
+                            called_tool.tool_input,
+                            user_session.user_id_token,
                         )
                         return {"tool": called_tool.tool, "params": flight_info}
                     return {"tool": called_tool.tool, "params": called_tool.tool_input}
@@ -160,20 +245,34 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
         if "history" not in session:
             session["history"] = [BASE_HISTORY]
         history = self.parse_messages(session["history"])
-        client = await self.create_client_session()
-        tools = await initialize_tools(client)
+        if self.client is None:
+            # Users only differ by their ID token, which is sent per request,
+            # so they all share one session and its connection pool
+            self.client = await self.create_client_session()
+        if self.llm is None:
+            # The model client is stateless, so all agents can share it
+            self.llm = ChatVertexAI(
+                max_output_tokens=512, model_name=self.MODEL, temperature=0.0
+            )
+        tools = await initialize_tools()
         prompt = self.create_prompt_template(tools)
-        agent = UserAgent.initialize_agent(client, tools, history, prompt, self.MODEL)
+        agent = UserAgent.initialize_agent(
+            self.client, tools, history, prompt, self.llm
+        )
+        self.evict_user_sessions()
         self._user_sessions[id] = agent
-        self.confirmation_needing_tools = get_confirmation_needing_tools()
-        self.client = client
+        self.confirmation_needing_tools = frozenset(get_confirmation_needing_tools())
 
     async def user_session_invoke(self, uuid: str, prompt: str) -> dict[str, Any]:
-        user_session = self.get_user_session(uuid)
-        # Send prompt to LLM
-        agent_response = await user_session.invoke(prompt)
-        # Check for calls that may require confirmation to proceed
-        confirmation = await self.check_and_add_confirmations(agent_response)
+        # Keep the session from being evicted until its confirmation is stored
+        with self.get_user_session(uuid).in_use() as user_session:
+            # Send prompt to LLM
+            agent_response = await user_session.invoke(prompt)
+            # Check for calls that may require confirmation to proceed
+            confirmation = await self.check_and_add_confirmations(
+                user_session, agent_response
+            )
+            user_session.pending_confirmation = confirmation is not None
         # Build final response
         response = {}
         response["output"] = agent_response.get("output")
@@ -183,18 +282,50 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
 
     def user_session_reset(self, session: dict[str, Any], uuid: str):
         user_session = self.get_user_session(uuid)
-        del session["history"]
         base_history = self.get_base_history(session)
         session["history"] = [base_history]
         history = self.parse_messages(session["history"])
         user_session.reset_memory(history)
 
     def get_user_session(self, uuid: str) -> UserAgent:
-        return self._user_sessions[uuid]
+        # Move the session to the end, keeping sessions ordered by last use
+        user_session = self._user_sessions.pop(uuid)
+        user_session.last_used = time.monotonic()
+        self._user_sessions[uuid] = user_session
+        return user_session
+
+    def evict_user_sessions(self):
+        """Drop idle user sessions to make room for a new one."""
+        expired = time.monotonic() - SESSION_TTL_SECONDS
+        excess = len(self._user_sessions) - MAX_SESSIONS + 1
+        evicted = []
+        # Sessions are ordered by last use, least recently used first
+        for uuid, user_session in self._user_sessions.items():
+            is_expired = user_session.last_used <= expired
+            if not is_expired and len(evicted) >= excess:
+                break
+            if user_session.active_calls:
+                # Still handling a request, which would otherwise finish on a
+                # user session that is no longer stored
+                continue
+            # Sessions waiting on a booking confirmation are only dropped once
+            # expired, even if that keeps more than MAX_SESSIONS around
+            if is_expired or not user_session.pending_confirmation:
+                evicted.append(uuid)
+        for uuid in evicted:
+            del self._user_sessions[uuid]
+
+    def set_user_session_header(self, uuid: str, user_id_token: str):
+        self.get_user_session(uuid).user_id_token = user_id_token
+
+    def get_user_id_token(self, uuid: str) -> Optional[str]:
+        if self.user_session_exist(uuid):
+            return self.get_user_session(uuid).user_id_token
+        return None
 
     async def get_connector(self) -> TCPConnector:
         if self.connector is None:
-            self.connector = TCPConnector(limit=100)
+            self.connector = create_connector()
         return self.connector
 
     async def create_client_session(self) -> ClientSession:
@@ -206,48 +337,43 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
         )
 
     def create_prompt_template(self, tools: List[StructuredTool]) -> ChatPromptTemplate:
-        # Create new prompt template
-        tool_strings = "\n".join(
-            [f"> {tool.name}: {tool.description}" for tool in tools]
-        )
-        tool_names = ", ".join([tool.name for tool in tools])
-        format_instructions = FORMAT_INSTRUCTIONS.format(
-            tool_names=tool_names,
-        )
-        current_datetime = "Today's date and current time is {cur_datetime}."
-        template = "\n\n".join(
-            [
-                PREFIX,
-                current_datetime,
-                TOOLS_PREFIX,
-                tool_strings,
-                format_instructions,
-                SUFFIX,
-            ]
-        )
-        human_message_template = "{input}\n\n{agent_scratchpad}"
-
-        prompt = ChatPromptTemplate.from_messages(
-            [("system", template), ("human", human_message_template)]
-        )
-        prompt = prompt.partial(cur_datetime=self.get_datetime)
+        # The tools are shared by all users, so the template only needs to be
+        # built once per tool set
+        tool_signature = tuple((tool.name, tool.description) for tool in tools)
+        prompt = self._prompts.get(tool_signature)
+        if prompt is None:
+            prompt = build_prompt_template(tool_signature)
+            prompt = prompt.partial(cur_datetime=self.get_datetime)
+            self._prompts[tool_signature] = prompt
         return prompt
 
     def get_datetime(self):
-        formatter = "%A, %m/%d/%Y, %H:%M:%S"
-        now = datetime.now(timezone("US/Pacific"))
-        return now.strftime(formatter)
+        global CURRENT_DATETIME
+        # The prompt only shows whole seconds, so format at most once a second
+        now = int(time.time())
+        if CURRENT_DATETIME[0] != now:
+            current_datetime = datetime.fromtimestamp(now, PACIFIC_TIMEZONE)
+            CURRENT_DATETIME = (now, current_datetime.strftime(DATETIME_FORMATTER))
+        return CURRENT_DATETIME[1]
 
     def parse_messages(self, datas: List[Any]) -> List[BaseMessage]:
-        messages: List[BaseMessage] = []
-        for data in datas:
-            if data["type"] == "human":
-                messages.append(HumanMessage(content=data["data"]["content"]))
-            elif data["type"] == "ai":
-                messages.append(AIMessage(content=data["data"]["content"]))
-            else:
-                raise Exception("Message type not found.")
-        return messages
+        if datas == [BASE_HISTORY]:
+            # Most sessions start from the default greeting
+            return [BASE_HISTORY_MESSAGE]
+        try:
+            return [
+                MESSAGE_TYPES[data["type"]](content=data["data"]["content"])
+                for data in datas
+            ]
+        except KeyError:
+            # Only look for the offending record once parsing has failed
+            for data in datas:
+                message_type = data.get("type")
+                if message_type not in MESSAGE_TYPES:
+                    raise ValueError(
+                        f"Unknown message type: {message_type!r}"
+                    ) from None
+            raise
 
     def get_base_history(self, session: dict[str, Any]):
         if "user_info" in session:
@@ -263,14 +389,15 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
     async def user_session_signout(self, uuid: str):
         user_session = self.get_user_session(uuid)
         if user_session:
-            await user_session.close()
             del self._user_sessions[uuid]
 
     async def close_clients(self):
-        close_client_tasks = [
-            asyncio.create_task(a.close()) for a in self._user_sessions.values()
-        ]
-        await asyncio.gather(*close_client_tasks)
+        self._user_sessions.clear()
+        if self.client:
+            await self.client.close()
+        # The session does not own the shared connector, so close it as well
+        if self.connector:
+            await self.connector.close()
 
 
 PREFIX = """The Cymbal Air Customer Service Assistant helps customers of Cymbal Air with their travel needs.
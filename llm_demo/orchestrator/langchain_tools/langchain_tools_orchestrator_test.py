@@ -0,0 +1,78 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from . import langchain_tools_orchestrator
+from .langchain_tools_orchestrator import LangChainToolsOrchestrator, UserAgent
+
+
+def add_user_session(orc: LangChainToolsOrchestrator, uuid: str, idle: float):
+    user_session = UserAgent(MagicMock(), MagicMock(), MagicMock())
+    user_session.last_used = time.monotonic() - idle
+    orc._user_sessions[uuid] = user_session
+    return user_session
+
+
+def test_evict_user_sessions_keeps_pending_confirmations(monkeypatch):
+    monkeypatch.setattr(langchain_tools_orchestrator, "MAX_SESSIONS", 3)
+    monkeypatch.setattr(langchain_tools_orchestrator, "SESSION_TTL_SECONDS", 60)
+    orc = LangChainToolsOrchestrator()
+    add_user_session(orc, "pending", idle=30).pending_confirmation = True
+    add_user_session(orc, "idle", idle=20)
+    add_user_session(orc, "active", idle=10)
+
+    orc.evict_user_sessions()
+
+    # Makes room by dropping the least recently used session without a
+    # pending confirmation
+    assert list(orc._user_sessions) == ["pending", "active"]
+
+
+def test_evict_user_sessions_drops_expired_sessions(monkeypatch):
+    monkeypatch.setattr(langchain_tools_orchestrator, "SESSION_TTL_SECONDS", 60)
+    orc = LangChainToolsOrchestrator()
+    add_user_session(orc, "expired", idle=120).pending_confirmation = True
+    add_user_session(orc, "active", idle=10)
+
+    orc.evict_user_sessions()
+
+    assert list(orc._user_sessions) == ["active"]
+
+
+@pytest.mark.asyncio
+async def test_evict_user_sessions_keeps_sessions_in_use(monkeypatch):
+    monkeypatch.setattr(langchain_tools_orchestrator, "MAX_SESSIONS", 1)
+    orc = LangChainToolsOrchestrator()
+    orc.confirmation_needing_tools = frozenset()
+    user_session = add_user_session(orc, "uuid", idle=0)
+
+    async def ainvoke(inputs):
+        # Another user's session is created while this request is running
+        orc.evict_user_sessions()
+        return {"output": "Hello!"}
+
+    user_session.agent.ainvoke = AsyncMock(side_effect=ainvoke)
+
+    response = await orc.user_session_invoke("uuid", "Hi")
+
+    assert response == {"output": "Hello!"}
+    assert orc._user_sessions == {"uuid": user_session}
+    assert user_session.active_calls == 0
+    # Once the request is done the session can be evicted again
+    orc.evict_user_sessions()
+    assert orc._user_sessions == {}
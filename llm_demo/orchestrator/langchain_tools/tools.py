@@ -13,51 +13,30 @@
 # limitations under the License.
 
 import json
-import os
+from contextvars import ContextVar
 from datetime import date, datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import aiohttp
-import google.oauth2.id_token  # type: ignore
-from google.auth import compute_engine  # type: ignore
-from google.auth.transport.requests import Request  # type: ignore
+import orjson
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
 
-BASE_URL = os.getenv("BASE_URL", default="http://127.0.0.1:8080")
-CREDENTIALS = None
+from ..retrieval_client import BASE_URL, get_headers, get_search_response
 
+# The tools and aiohttp session are shared by all users, each agent sets the
+# session and its user's ID token here while it runs
+CLIENT: ContextVar[aiohttp.ClientSession] = ContextVar("client")
+USER_ID_TOKEN: ContextVar[Optional[str]] = ContextVar("user_id_token", default=None)
+TOOLS: Optional[List[StructuredTool]] = None
 
-def filter_none_values(params: Dict) -> Dict:
-    return {key: value for key, value in params.items() if value is not None}
 
-
-def get_id_token():
-    global CREDENTIALS
-    if CREDENTIALS is None:
-        CREDENTIALS, _ = google.auth.default()
-        if not hasattr(CREDENTIALS, "id_token"):
-            # Use Compute Engine default credential
-            CREDENTIALS = compute_engine.IDTokenCredentials(
-                request=Request(),
-                target_audience=BASE_URL,
-                use_metadata_identity_endpoint=True,
-            )
-    if not CREDENTIALS.valid:
-        CREDENTIALS.refresh(Request())
-    if hasattr(CREDENTIALS, "id_token"):
-        return CREDENTIALS.id_token
-    else:
-        return CREDENTIALS.token
-
-
-def get_headers(client: aiohttp.ClientSession):
-    """Helper method to generate ID tokens for authenticated requests"""
-    headers = client.headers
-    if not "http://" in BASE_URL:
-        # Append ID Token to make authenticated requests to Cloud Run services
-        headers["Authorization"] = f"Bearer {get_id_token()}"
-    return headers
+async def get_search_results(path: str, params: Dict[str, Any]) -> Any:
+    """Fetch the results of a read-only retrieval service search"""
+    response_json = await get_search_response(
+        CLIENT.get(), path, params, USER_ID_TOKEN.get()
+    )
+    return response_json.get("results")
 
 
 # Tools
@@ -67,21 +46,14 @@ class AirportSearchInput(BaseModel):
     name: Optional[str] = Field(description="Airport name")
 
 
-def generate_search_airports(client: aiohttp.ClientSession):
+def generate_search_airports():
     async def search_airports(country: str, city: str, name: str):
         params = {
-            "country": country,
-            "city": city,
-            "name": name,
+            key: value
+            for key, value in (("country", country), ("city", city), ("name", name))
+            if value is not None
         }
-        response = await client.get(
-            url=f"{BASE_URL}/airports/search",
-            params=filter_none_values(params),
-            headers=get_headers(client),
-        )
-
-        response_json = await response.json()
-        response_results = response_json.get("results")
+        response_results = await get_search_results("/airports/search", params)
         if len(response_results) < 1:
             return "There are no airports matching that query. Let the user know there are no results."
         else:
@@ -95,16 +67,10 @@ class FlightNumberInput(BaseModel):
     flight_number: str = Field(description="1 to 4 digit number")
 
 
-def generate_search_flights_by_number(client: aiohttp.ClientSession):
+def generate_search_flights_by_number():
     async def search_flights_by_number(airline: str, flight_number: str):
-        response = await client.get(
-            url=f"{BASE_URL}/flights/search",
-            params={"airline": airline, "flight_number": flight_number},
-            headers=get_headers(client),
-        )
-
-        response_json = await response.json()
-        return response_json.get("results")
+        params = {"airline": airline, "flight_number": flight_number}
+        return await get_search_results("/flights/search", params)
 
     return search_flights_by_number
 
@@ -117,25 +83,22 @@ class ListFlights(BaseModel):
     date: str = Field(description="Date of flight departure")
 
 
-def generate_list_flights(client: aiohttp.ClientSession):
+def generate_list_flights():
     async def list_flights(
         departure_airport: str,
         arrival_airport: str,
         date: str,
     ):
         params = {
-            "departure_airport": departure_airport,
-            "arrival_airport": arrival_airport,
-            "date": date,
+            key: value
+            for key, value in (
+                ("departure_airport", departure_airport),
+                ("arrival_airport", arrival_airport),
+                ("date", date),
+            )
+            if value is not None
         }
-        response = await client.get(
-            url=f"{BASE_URL}/flights/search",
-            params=filter_none_values(params),
-            headers=get_headers(client),
-        )
-
-        response_json = await response.json()
-        response_results = response_json.get("results")
+        response_results = await get_search_results("/flights/search", params)
         if len(response_results) < 1:
             return "There are no flights matching that query. Let the user know there are no results."
         else:
@@ -148,32 +111,18 @@ class QueryInput(BaseModel):
     query: str = Field(description="Search query")
 
 
-def generate_search_amenities(client: aiohttp.ClientSession):
+def generate_search_amenities():
     async def search_amenities(query: str):
-        response = await client.get(
-            url=f"{BASE_URL}/amenities/search",
-            params={"top_k": "5", "query": query},
-            headers=get_headers(client),
-        )
-
-        response_json = await response.json()
-        response_results = response_json.get("results")
-        return response_results
+        params = {"top_k": "5", "query": query}
+        return await get_search_results("/amenities/search", params)
 
     return search_amenities
 
 
-def generate_search_policies(client: aiohttp.ClientSession):
+def generate_search_policies():
     async def search_policies(query: str):
-        response = await client.get(
-            url=f"{BASE_URL}/policies/search",
-            params={"top_k": "5", "query": query},
-            headers=get_headers(client),
-        )
-
-        response_json = await response.json()
-        response_results = response_json.get("results")
-        return response_results
+        params = {"top_k": "5", "query": query}
+        return await get_search_results("/policies/search", params)
 
     return search_policies
 
@@ -189,7 +138,7 @@ class TicketInput(BaseModel):
     arrival_time: Optional[datetime] = Field(description="Flight arrival datetime")
 
 
-def generate_insert_ticket(client: aiohttp.ClientSession):
+def generate_insert_ticket():
     async def insert_ticket(
         airline: str | None = None,
         flight_number: str | None = None,
@@ -203,9 +152,11 @@ def generate_insert_ticket(client: aiohttp.ClientSession):
     return insert_ticket
 
 
-async def insert_ticket(client: aiohttp.ClientSession, params: str):
+async def insert_ticket(
+    client: aiohttp.ClientSession, params: str, user_id_token: Optional[str]
+):
     ticket_info = json.loads(params)
-    response = await client.post(
+    async with client.post(
         url=f"{BASE_URL}/tickets/insert",
         params={
             "airline": ticket_info.get("airline"),
@@ -215,28 +166,34 @@ async def insert_ticket(client: aiohttp.ClientSession, params: str):
             "departure_time": ticket_info.get("departure_time").replace("T", " "),
             "arrival_time": ticket_info.get("arrival_time").replace("T", " "),
         },
-        headers=get_headers(client),
-    )
-    response_json = await response.json()
+        headers=await get_headers(user_id_token),
+    ) as response:
+        response_json = await response.json(loads=orjson.loads)
     return "Flight booking successful."
 
 
-async def validate_ticket(client: aiohttp.ClientSession, ticket_info: Dict[Any, Any]):
-    response = await client.get(
+async def validate_ticket(
+    client: aiohttp.ClientSession,
+    ticket_info: Dict[Any, Any],
+    user_id_token: Optional[str],
+):
+    departure_time = ticket_info.get("departure_time", "").replace("T", " ")
+    params = {
+        key: value
+        for key, value in (
+            ("airline", ticket_info.get("airline")),
+            ("flight_number", ticket_info.get("flight_number")),
+            ("departure_airport", ticket_info.get("departure_airport")),
+            ("departure_time", departure_time),
+        )
+        if value is not None
+    }
+    async with client.get(
         url=f"{BASE_URL}/tickets/validate",
-        params=filter_none_values(
-            {
-                "airline": ticket_info.get("airline"),
-                "flight_number": ticket_info.get("flight_number"),
-                "departure_airport": ticket_info.get("departure_airport"),
-                "departure_time": ticket_info.get("departure_time", "").replace(
-                    "T", " "
-                ),
-            }
-        ),
-        headers=get_headers(client),
-    )
-    response_json = await response.json()
+        params=params,
+        headers=await get_headers(user_id_token),
+    ) as response:
+        response_json = await response.json(loads=orjson.loads)
     response_results = response_json.get("results")
 
     flight_info = {
@@ -250,14 +207,17 @@ async def validate_ticket(client: aiohttp.ClientSession, ticket_info: Dict[Any,
     return flight_info
 
 
-def generate_list_tickets(client: aiohttp.ClientSession):
+class ListTicketsInput(BaseModel):
+    pass
+
+
+def generate_list_tickets():
     async def list_tickets():
-        response = await client.get(
+        async with CLIENT.get().get(
             url=f"{BASE_URL}/tickets/list",
-            headers=get_headers(client),
-        )
-
-        response_json = await response.json()
+            headers=await get_headers(USER_ID_TOKEN.get()),
+        ) as response:
+            response_json = await response.json(loads=orjson.loads)
         tickets = response_json.get("results")
         if len(tickets) == 0:
             return {
@@ -271,10 +231,17 @@ def generate_list_tickets(client: aiohttp.ClientSession):
 
 
 # Tools for agent
-async def initialize_tools(client: aiohttp.ClientSession):
+async def initialize_tools() -> List[StructuredTool]:
+    global TOOLS
+    if TOOLS is None:
+        TOOLS = build_tools()
+    return TOOLS
+
+
+def build_tools() -> List[StructuredTool]:
     return [
         StructuredTool.from_function(
-            coroutine=generate_search_airports(client),
+            coroutine=generate_search_airports(),
             name="Search Airport",
             description="""
                         Use this tool to list all airports matching search criteria.
@@ -303,7 +270,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=AirportSearchInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_search_flights_by_number(client),
+            coroutine=generate_search_flights_by_number(),
             name="Search Flights By Flight Number",
             description="""
                         Use this tool to get information for a specific flight.
@@ -328,7 +295,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=FlightNumberInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_list_flights(client),
+            coroutine=generate_list_flights(),
             name="List Flights",
             description="""
                         Use this tool to list flights information matching search criteria.
@@ -359,7 +326,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=ListFlights,
         ),
         StructuredTool.from_function(
-            coroutine=generate_search_amenities(client),
+            coroutine=generate_search_amenities(),
             name="Search Amenities",
             description="""
                         Use this tool to search amenities by name or to recommended airport amenities at SFO.
@@ -374,7 +341,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=QueryInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_search_policies(client),
+            coroutine=generate_search_policies(),
             name="Search Policies",
             description="""
                         Use this tool to search for cymbal air passenger policy.
@@ -386,7 +353,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=QueryInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_insert_ticket(client),
+            coroutine=generate_insert_ticket(),
             name="Insert Ticket",
             description="""
                         Use this tool to book a flight ticket for the user.
@@ -421,13 +388,14 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=TicketInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_list_tickets(client),
+            coroutine=generate_list_tickets(),
             name="List Tickets",
             description="""
                         Use this tool to list a user's flight tickets.
                         Takes no input and returns a list of current user's flight tickets.
                         Input is always empty JSON blob. Example: {{}}
                         """,
+            args_schema=ListTicketsInput,
         ),
     ]
 
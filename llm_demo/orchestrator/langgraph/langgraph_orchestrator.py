@@ -14,9 +14,21 @@
 
 import asyncio
 import os
+import time
 import uuid
 from datetime import datetime
-from typing import Annotated, Any, Dict, List, Literal, Optional, Sequence, TypedDict
+from typing import (
+    Annotated,
+    Any,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypedDict,
+)
 
 from aiohttp import ClientSession, TCPConnector
 from fastapi import HTTPException
@@ -30,6 +42,7 @@ from langgraph.checkpoint.memory import MemorySaver
 from pytz import timezone
 
 from ..orchestrator import BaseOrchestrator, classproperty
+from ..retrieval_client import create_connector
 from .react_graph import create_graph
 from .tools import initialize_tools
 
@@ -39,6 +52,14 @@ BASE_HISTORY = {
     "type": "ai",
     "data": {"content": "Welcome to Cymbal Air!  How may I assist you?"},
 }
+MESSAGE_TYPES: Dict[str, Type[BaseMessage]] = {
+    "human": HumanMessage,
+    "ai": AIMessage,
+}
+PACIFIC_TIMEZONE = timezone("US/Pacific")
+DATETIME_FORMATTER = "%A, %m/%d/%Y, %H:%M:%S"
+# Last formatted datetime and the unix second it was formatted for
+CURRENT_DATETIME: Tuple[int, str] = (-1, "")
 
 
 class LangGraphOrchestrator(BaseOrchestrator):
@@ -74,15 +95,18 @@ class LangGraphOrchestrator(BaseOrchestrator):
 
     async def user_session_create(self, session: dict[str, Any]):
         """Create and load an agent executor with tools and LLM."""
-        client = await self.create_client_session()
         if self._langgraph_app is None:
             print("Initializing graph..")
+            # The graph and its tools are shared by all users, which pass their
+            # ID token through the graph state, so they share one session too
+            client = await self.create_client_session()
             tools = await initialize_tools(client)
             prompt = self.create_prompt_template(tools)
             checkpointer = MemorySaver()
             langgraph_app = await create_graph(
                 tools, checkpointer, prompt, self.MODEL, client, DEBUG
             )
+            self.client = client
             self._checkpointer = checkpointer
             self._langgraph_app = langgraph_app
 
@@ -97,7 +121,6 @@ class LangGraphOrchestrator(BaseOrchestrator):
         config = self.get_config(session_id)
         self._langgraph_app.update_state(config, {"messages": history})
         self._user_sessions[session_id] = ""
-        self.client = client
 
     async def user_session_invoke(
         self, uuid: str, user_prompt: Optional[str]
@@ -152,7 +175,6 @@ class LangGraphOrchestrator(BaseOrchestrator):
         return trace
 
     def user_session_reset(self, session: dict[str, Any], uuid: str):
-        del session["history"]
         base_history = self.get_base_history(session)
         session["history"] = [base_history]
         history = self.parse_messages(session["history"])
@@ -178,7 +200,7 @@ class LangGraphOrchestrator(BaseOrchestrator):
 
     async def get_connector(self) -> TCPConnector:
         if self.connector is None:
-            self.connector = TCPConnector(limit=100)
+            self.connector = create_connector()
         return self.connector
 
     async def create_client_session(self) -> ClientSession:
@@ -199,14 +221,16 @@ class LangGraphOrchestrator(BaseOrchestrator):
             tool_names=tool_names,
         )
         current_datetime = "Today's date and current time is {cur_datetime}."
+        # Put the changing datetime last, so that the long static prefix stays
+        # byte-identical across turns for prompt caching
         template = "\n\n".join(
             [
                 PREFIX,
-                current_datetime,
                 TOOLS_PREFIX,
                 tool_strings,
                 format_instructions,
                 SUFFIX,
+                current_datetime,
             ]
         )
 
@@ -217,20 +241,29 @@ class LangGraphOrchestrator(BaseOrchestrator):
         return prompt
 
     def get_datetime(self):
-        formatter = "%A, %m/%d/%Y, %H:%M:%S"
-        now = datetime.now(timezone("US/Pacific"))
-        return now.strftime(formatter)
+        global CURRENT_DATETIME
+        # The prompt only shows whole seconds, so format at most once a second
+        now = int(time.time())
+        if CURRENT_DATETIME[0] != now:
+            current_datetime = datetime.fromtimestamp(now, PACIFIC_TIMEZONE)
+            CURRENT_DATETIME = (now, current_datetime.strftime(DATETIME_FORMATTER))
+        return CURRENT_DATETIME[1]
 
     def parse_messages(self, datas: List[Any]) -> List[BaseMessage]:
-        messages: List[BaseMessage] = []
-        for data in datas:
-            if data["type"] == "human":
-                messages.append(HumanMessage(content=data["data"]["content"]))
-            elif data["type"] == "ai":
-                messages.append(AIMessage(content=data["data"]["content"]))
-            else:
-                raise Exception("Message type not found.")
-        return messages
+        try:
+            return [
+                MESSAGE_TYPES[data["type"]](content=data["data"]["content"])
+                for data in datas
+            ]
+        except KeyError:
+            # Only look for the offending record once parsing has failed
+            for data in datas:
+                message_type = data.get("type")
+                if message_type not in MESSAGE_TYPES:
+                    raise ValueError(
+                        f"Unknown message type: {message_type!r}"
+                    ) from None
+            raise
 
     def get_base_history(self, session: dict[str, Any]):
         if "user_info" in session:
@@ -253,8 +286,12 @@ class LangGraphOrchestrator(BaseOrchestrator):
         del self._user_sessions[uuid]
 
     async def close_clients(self):
+        self._user_sessions.clear()
         if self.client:
             await self.client.close()
+        # The session does not own the shared connector, so close it as well
+        if self.connector:
+            await self.connector.close()
 
 
 PREFIX = """The Cymbal Air Customer Service Assistant helps customers of Cymbal Air with their travel needs.
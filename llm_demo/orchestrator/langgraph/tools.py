@@ -13,53 +13,16 @@
 # limitations under the License.
 
 import json
-import os
 from dataclasses import dataclass
 from datetime import date, datetime
 from typing import Any, Dict, Optional
 
 import aiohttp
-import google.oauth2.id_token  # type: ignore
-from google.auth import compute_engine  # type: ignore
-from google.auth.transport.requests import Request  # type: ignore
+import orjson
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
 
-BASE_URL = os.getenv("BASE_URL", default="http://127.0.0.1:8080")
-CREDENTIALS = None
-
-
-def filter_none_values(params: Dict) -> Dict:
-    return {key: value for key, value in params.items() if value is not None}
-
-
-def get_id_token():
-    global CREDENTIALS
-    if CREDENTIALS is None:
-        CREDENTIALS, _ = google.auth.default()
-        if not hasattr(CREDENTIALS, "id_token"):
-            # Use Compute Engine default credential
-            CREDENTIALS = compute_engine.IDTokenCredentials(
-                request=Request(),
-                target_audience=BASE_URL,
-                use_metadata_identity_endpoint=True,
-            )
-    if not CREDENTIALS.valid:
-        CREDENTIALS.refresh(Request())
-    if hasattr(CREDENTIALS, "id_token"):
-        return CREDENTIALS.id_token
-    else:
-        return CREDENTIALS.token
-
-
-def get_headers(client: aiohttp.ClientSession, user_id_token: str):
-    """Helper method to generate ID tokens for authenticated requests"""
-    headers = client.headers
-    headers["User-Id-Token"] = f"Bearer {user_id_token}"
-    if not "http://" in BASE_URL:
-        # Append ID Token to make authenticated requests to Cloud Run services
-        headers["Authorization"] = f"Bearer {get_id_token()}"
-    return headers
+from ..retrieval_client import BASE_URL, get_headers, get_search_response
 
 
 # Tools
@@ -73,17 +36,13 @@ class AirportSearchInput(BaseModel):
 def generate_search_airports(client: aiohttp.ClientSession):
     async def search_airports(country: str, city: str, name: str, user_id_token: str):
         params = {
-            "country": country,
-            "city": city,
-            "name": name,
+            key: value
+            for key, value in (("country", country), ("city", city), ("name", name))
+            if value is not None
         }
-        response = await client.get(
-            url=f"{BASE_URL}/airports/search",
-            params=filter_none_values(params),
-            headers=get_headers(client, user_id_token),
+        response_json = await get_search_response(
+            client, "/airports/search", params, user_id_token
         )
-
-        response_json = await response.json()
         if len(response_json) < 1:
             return "There are no airports matching that query. Let the user know there are no results."
         else:
@@ -102,14 +61,11 @@ def generate_search_flights_by_number(client: aiohttp.ClientSession):
     async def search_flights_by_number(
         airline: str, flight_number: str, user_id_token: str
     ):
-        response = await client.get(
-            url=f"{BASE_URL}/flights/search",
-            params={"airline": airline, "flight_number": flight_number},
-            headers=get_headers(client, user_id_token),
+        params = {"airline": airline, "flight_number": flight_number}
+        return await get_search_response(
+            client, "/flights/search", params, user_id_token
         )
 
-        return await response.json()
-
     return search_flights_by_number
 
 
@@ -130,17 +86,17 @@ def generate_list_flights(client: aiohttp.ClientSession):
         user_id_token: str,
     ):
         params = {
-            "departure_airport": departure_airport,
-            "arrival_airport": arrival_airport,
-            "date": date,
+            key: value
+            for key, value in (
+                ("departure_airport", departure_airport),
+                ("arrival_airport", arrival_airport),
+                ("date", date),
+            )
+            if value is not None
         }
-        response = await client.get(
-            url=f"{BASE_URL}/flights/search",
-            params=filter_none_values(params),
-            headers=get_headers(client, user_id_token),
+        response_json = await get_search_response(
+            client, "/flights/search", params, user_id_token
         )
-
-        response_json = await response.json()
         if len(response_json) < 1:
             return {
                 "results": "There are no flights matching that query. Let the user know there are no results."
@@ -158,29 +114,21 @@ class QueryInput(BaseModel):
 
 def generate_search_amenities(client: aiohttp.ClientSession):
     async def search_amenities(query: str, user_id_token: str):
-        response = await client.get(
-            url=f"{BASE_URL}/amenities/search",
-            params={"top_k": "5", "query": query},
-            headers=get_headers(client, user_id_token),
+        params = {"top_k": "5", "query": query}
+        return await get_search_response(
+            client, "/amenities/search", params, user_id_token
         )
 
-        response = await response.json()
-        return response
-
     return search_amenities
 
 
 def generate_search_policies(client: aiohttp.ClientSession):
     async def search_policies(query: str, user_id_token: str):
-        response = await client.get(
-            url=f"{BASE_URL}/policies/search",
-            params={"top_k": "5", "query": query},
-            headers=get_headers(client, user_id_token),
+        params = {"top_k": "5", "query": query}
+        return await get_search_response(
+            client, "/policies/search", params, user_id_token
         )
 
-        response = await response.json()
-        return response
-
     return search_policies
 
 
@@ -222,7 +170,7 @@ class TicketInfo:
 async def insert_ticket(
     client: aiohttp.ClientSession, ticket_info: TicketInfo, user_id_token: str
 ):
-    response = await client.post(
+    async with client.post(
         url=f"{BASE_URL}/tickets/insert",
         params={
             "airline": ticket_info.airline,
@@ -232,30 +180,32 @@ async def insert_ticket(
             "departure_time": ticket_info.departure_time.replace("T", " "),
             "arrival_time": ticket_info.arrival_time.replace("T", " "),
         },
-        headers=get_headers(client, user_id_token),
-    )
-    response = await response.json()
+        headers=await get_headers(user_id_token),
+    ) as response:
+        response_json = await response.json(loads=orjson.loads)
     return "Flight booking successful."
 
 
 async def validate_ticket(
     client: aiohttp.ClientSession, ticket_info: Dict[Any, Any], user_id_token: str
 ):
-    response = await client.get(
+    departure_time = ticket_info.get("departure_time", "").replace("T", " ")
+    params = {
+        key: value
+        for key, value in (
+            ("airline", ticket_info.get("airline")),
+            ("flight_number", ticket_info.get("flight_number")),
+            ("departure_airport", ticket_info.get("departure_airport")),
+            ("departure_time", departure_time),
+        )
+        if value is not None
+    }
+    async with client.get(
         url=f"{BASE_URL}/tickets/validate",
-        params=filter_none_values(
-            {
-                "airline": ticket_info.get("airline"),
-                "flight_number": ticket_info.get("flight_number"),
-                "departure_airport": ticket_info.get("departure_airport"),
-                "departure_time": ticket_info.get("departure_time", "").replace(
-                    "T", " "
-                ),
-            }
-        ),
-        headers=get_headers(client, user_id_token),
-    )
-    response_json = await response.json()
+        params=params,
+        headers=await get_headers(user_id_token),
+    ) as response:
+        response_json = await response.json(loads=orjson.loads)
     response_results = response_json.get("results")
 
     flight_info = {
@@ -269,14 +219,17 @@ async def validate_ticket(
     return flight_info
 
 
+class ListTicketsInput(BaseModel):
+    user_id_token: Optional[str]
+
+
 def generate_list_tickets(client: aiohttp.ClientSession):
     async def list_tickets(user_id_token: str):
-        response = await client.get(
+        async with client.get(
             url=f"{BASE_URL}/tickets/list",
-            headers=get_headers(client, user_id_token),
-        )
-
-        response_json = await response.json()
+            headers=await get_headers(user_id_token),
+        ) as response:
+            response_json = await response.json(loads=orjson.loads)
         tickets = response_json.get("results")
         if len(tickets) == 0:
             return {
@@ -447,6 +400,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
                         Takes no input and returns a list of current user's flight tickets.
                         Input is always empty JSON blob. Example: {{}}
                         """,
+            args_schema=ListTicketsInput,
         ),
     ]
 
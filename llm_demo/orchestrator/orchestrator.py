@@ -69,20 +69,15 @@ class BaseOrchestrator(ABC):
         """Sign out from user session. Clear and restart session."""
         raise NotImplementedError("Subclass should implement this!")
 
+    @abstractmethod
     def set_user_session_header(self, uuid: str, user_id_token: str):
-        user_session = self.get_user_session(uuid)
-        user_session.client.headers["User-Id-Token"] = f"Bearer {user_id_token}"
+        """Set the ID token sent on behalf of the user session."""
+        raise NotImplementedError("Subclass should implement this!")
 
+    @abstractmethod
     def get_user_id_token(self, uuid: str) -> Optional[str]:
-        if self.user_session_exist(uuid):
-            user_session = self.get_user_session(uuid)
-            if user_session.client and "User-Id-Token" in user_session.client.headers:
-                token = user_session.client.headers["User-Id-Token"]
-                parts = str(token).split(" ")
-                if len(parts) != 2 or parts[0] != "Bearer":
-                    raise Exception("Invalid ID token")
-                return parts[1]
-        return None
+        """Return the ID token of the user session, if signed in."""
+        raise NotImplementedError("Subclass should implement this!")
 
 
 def createOrchestrator(orchestration_type: str) -> "BaseOrchestrator":
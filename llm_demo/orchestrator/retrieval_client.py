@@ -0,0 +1,166 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import aiohttp
+import orjson
+
+BASE_URL = os.getenv("BASE_URL", default="http://127.0.0.1:8080")
+# Only deployed (https) services require ID token authentication
+NEEDS_AUTH = not BASE_URL.startswith("http://")
+CREDENTIALS = None
+# Transport for refreshing the credentials, reused to keep its connection open
+AUTH_REQUEST = None
+# Cached ID token and its expiry (unix timestamp)
+ID_TOKEN: Optional[Tuple[str, float]] = None
+ID_TOKEN_LOCK = asyncio.Lock()
+# Refresh the ID token this many seconds before it expires
+ID_TOKEN_EXPIRY_SKEW = 60
+# Authorization headers for the cached ID token
+AUTH_HEADERS: Optional[Tuple[str, Mapping[str, str]]] = None
+NO_AUTH_HEADERS: Mapping[str, str] = MappingProxyType({})
+# Short-lived cache for read-only retrieval service lookups. Only shared,
+# non user-scoped data (airports, flights, amenities, policies) is cached.
+RESPONSE_CACHE_TTL = 60
+RESPONSE_CACHE_MAXSIZE = 256
+RESPONSE_CACHE: Dict[Tuple, Tuple[float, Any]] = {}
+# Ticket endpoints return the signed-in user's data and are never cached
+UNCACHED_PATH_PREFIX = "/tickets/"
+# Connection pool limit for requests to the retrieval service. Every request
+# goes to that one host, so this is effectively the per-host limit as well.
+CONNECTOR_LIMIT = int(os.getenv("AIOHTTP_LIMIT", default=200))
+
+
+def fetch_id_token() -> Tuple[str, float]:
+    """Refresh the ID token credentials and return the token with its expiry"""
+    global CREDENTIALS, AUTH_REQUEST
+    # Imported lazily since auth is only needed for deployed (https) services
+    import google.auth  # type: ignore
+    import google.oauth2.id_token  # type: ignore
+    from google.auth import jwt  # type: ignore
+    from google.auth.transport.requests import Request  # type: ignore
+
+    if AUTH_REQUEST is None:
+        AUTH_REQUEST = Request()
+    if CREDENTIALS is None:
+        CREDENTIALS, _ = google.auth.default()
+        if not hasattr(CREDENTIALS, "id_token"):
+            # Use a service account key file (GOOGLE_APPLICATION_CREDENTIALS)
+            # or the metadata server identity endpoint on Google Cloud
+            CREDENTIALS = google.oauth2.id_token.fetch_id_token_credentials(
+                BASE_URL, request=AUTH_REQUEST
+            )
+    CREDENTIALS.refresh(AUTH_REQUEST)
+    if hasattr(CREDENTIALS, "id_token"):
+        token = CREDENTIALS.id_token
+    else:
+        token = CREDENTIALS.token
+    claims = jwt.decode(token, verify=False)
+    return token, claims["exp"]
+
+
+async def get_id_token() -> str:
+    global ID_TOKEN
+    if ID_TOKEN is None or ID_TOKEN[1] - ID_TOKEN_EXPIRY_SKEW < time.time():
+        async with ID_TOKEN_LOCK:
+            # Another request may have refreshed the token while waiting
+            if ID_TOKEN is None or ID_TOKEN[1] - ID_TOKEN_EXPIRY_SKEW < time.time():
+                # Refreshing is a blocking HTTP call, keep it off the event loop
+                ID_TOKEN = await asyncio.to_thread(fetch_id_token)
+    return ID_TOKEN[0]
+
+
+async def get_auth_headers() -> Mapping[str, str]:
+    """Helper method to generate ID tokens for authenticated requests"""
+    global AUTH_HEADERS
+    if not NEEDS_AUTH:
+        return NO_AUTH_HEADERS
+    token = await get_id_token()
+    # Only rebuild the headers when the ID token rotates
+    if AUTH_HEADERS is None or AUTH_HEADERS[0] != token:
+        # Append ID Token to make authenticated requests to Cloud Run services
+        headers = MappingProxyType({"Authorization": f"Bearer {token}"})
+        AUTH_HEADERS = (token, headers)
+    return AUTH_HEADERS[1]
+
+
+async def get_headers(user_id_token: Optional[str]) -> Mapping[str, str]:
+    """Helper method to generate per-user headers for requests"""
+    if user_id_token is None:
+        return await get_auth_headers()
+    headers = {"User-Id-Token": f"Bearer {user_id_token}"}
+    headers.update(await get_auth_headers())
+    return headers
+
+
+def create_connector() -> aiohttp.TCPConnector:
+    # All requests go to the retrieval service, so keep idle connections and
+    # its DNS entry around between tool calls
+    return aiohttp.TCPConnector(
+        limit=CONNECTOR_LIMIT,
+        keepalive_timeout=75,
+        ttl_dns_cache=300,
+        enable_cleanup_closed=True,
+    )
+
+
+def get_cache_key(path: str, params: Dict[str, Any]) -> Tuple:
+    return (path, tuple(sorted(params.items())))
+
+
+def get_cached_response(key: Tuple) -> Any:
+    cached = RESPONSE_CACHE.get(key)
+    if cached is None:
+        return None
+    expiry, value = cached
+    if expiry < time.monotonic():
+        del RESPONSE_CACHE[key]
+        return None
+    return value
+
+
+def set_cached_response(key: Tuple, value: Any):
+    if key not in RESPONSE_CACHE and len(RESPONSE_CACHE) >= RESPONSE_CACHE_MAXSIZE:
+        # Evict the oldest entry
+        del RESPONSE_CACHE[next(iter(RESPONSE_CACHE))]
+    RESPONSE_CACHE[key] = (time.monotonic() + RESPONSE_CACHE_TTL, value)
+
+
+async def get_search_response(
+    client: aiohttp.ClientSession,
+    path: str,
+    params: Dict[str, Any],
+    user_id_token: Optional[str],
+) -> Any:
+    """Fetch the response of a read-only retrieval service search"""
+    cacheable = not path.startswith(UNCACHED_PATH_PREFIX)
+    cache_key = get_cache_key(path, params)
+    if cacheable:
+        response_json = get_cached_response(cache_key)
+        if response_json is not None:
+            return response_json
+    async with client.get(
+        url=f"{BASE_URL}{path}",
+        params=params,
+        headers=await get_headers(user_id_token),
+    ) as response:
+        response_json = await response.json(loads=orjson.loads)
+    if cacheable:
+        set_cached_response(cache_key, response_json)
+    return response_json
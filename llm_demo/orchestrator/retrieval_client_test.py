@@ -0,0 +1,64 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from . import retrieval_client
+
+
+@pytest.fixture(autouse=True)
+def no_auth(monkeypatch):
+    monkeypatch.setattr(retrieval_client, "NEEDS_AUTH", False)
+    monkeypatch.setattr(retrieval_client, "RESPONSE_CACHE", {})
+
+
+def mock_client(response_json):
+    client = MagicMock()
+    response = client.get.return_value.__aenter__.return_value
+    response.json = AsyncMock(return_value=response_json)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_get_search_response_caches_searches():
+    client = mock_client({"results": ["SFO"]})
+    params = {"country": "United States", "city": "San Francisco"}
+
+    first = await retrieval_client.get_search_response(
+        client, "/airports/search", params, None
+    )
+    # Same query with the params in a different order
+    second = await retrieval_client.get_search_response(
+        client, "/airports/search", dict(reversed(params.items())), None
+    )
+
+    assert first == second == {"results": ["SFO"]}
+    client.get.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_search_response_never_caches_tickets():
+    client = mock_client({"results": []})
+
+    for _ in range(2):
+        await retrieval_client.get_search_response(
+            client, "/tickets/list", {}, "user id token"
+        )
+
+    assert client.get.call_count == 2
+    assert retrieval_client.RESPONSE_CACHE == {}
+    headers = client.get.call_args.kwargs["headers"]
+    assert headers["User-Id-Token"] == "Bearer user id token"
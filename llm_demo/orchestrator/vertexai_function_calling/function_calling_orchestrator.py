@@ -14,10 +14,12 @@
 
 import asyncio
 import os
+import time
 import uuid
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import orjson
 from aiohttp import ClientSession, TCPConnector
 from fastapi import HTTPException
 from google.protobuf.json_format import MessageToDict  # type: ignore
@@ -30,12 +32,11 @@ from vertexai.preview.generative_models import (  # type: ignore
 )
 
 from ..orchestrator import BaseOrchestrator, classproperty
+from ..retrieval_client import BASE_URL, create_connector, get_headers
 from .functions import (
-    BASE_URL,
     assistant_tool,
     function_request,
     get_confirmation_needing_tools,
-    get_headers,
     insert_ticket,
 )
 
@@ -44,12 +45,17 @@ BASE_HISTORY = {
     "type": "ai",
     "data": {"content": "Welcome to Cymbal Air!  How may I assist you?"},
 }
+PACIFIC_TIMEZONE = timezone("US/Pacific")
+DATETIME_FORMATTER = "%A, %m/%d/%Y, %H:%M:%S"
+# Last built prompt and the unix second it was built for
+CURRENT_PROMPT: Tuple[int, str] = (-1, "")
 
 
 class UserModel:
     client: ClientSession
     model: GenerativeModel
     history: List[Content]
+    user_id_token: Optional[str] = None
 
     def __init__(self, client: ClientSession, model: GenerativeModel):
         self.client = client
@@ -61,9 +67,6 @@ class UserModel:
         model = GenerativeModel(model, tools=[assistant_tool()])
         return UserModel(client, model)
 
-    async def close(self):
-        await self.client.close()
-
     async def invoke(self, input_prompt: str) -> Dict[str, Any]:
         prompt = self.get_prompt()
         user_prompt_content = Content(
@@ -83,27 +86,38 @@ class UserModel:
         # implement multi turn chat with while loop
         while "function_call" in part_response._raw_part:
             self.history.append(response_function_call_content)
-            function_call = MessageToDict(part_response.function_call._pb)
-            function_name = function_call.get("name")
-            if function_name in get_confirmation_needing_tools():
-                function_response = self.confirmation_response(
-                    function_name, function_call.get("args")
-                )
-                confirmation = {
-                    "tool": function_name,
-                    "params": function_call.get("args"),
-                }
-            else:
-                function_response = await self.request_function(function_call)
-            self.debug_log(f"Function response:\n{function_response}")
-            part = Part.from_function_response(
-                name=function_call["name"],
-                response={
-                    "content": function_response,
-                },
+            function_calls = [
+                MessageToDict(part.function_call._pb)
+                for part in response_function_call_content.parts
+                if "function_call" in part._raw_part
+            ]
+            for function_call in function_calls:
+                function_name = function_call.get("name")
+                if function_name in get_confirmation_needing_tools():
+                    confirmation = {
+                        "tool": function_name,
+                        "params": function_call.get("args"),
+                    }
+            # Function calls requested in the same turn are independent,
+            # so run them concurrently
+            function_responses = await asyncio.gather(
+                *(self.call_function(function_call) for function_call in function_calls)
             )
+            parts = []
+            for function_call, function_response in zip(
+                function_calls, function_responses
+            ):
+                self.debug_log(f"Function response:\n{function_response}")
+                parts.append(
+                    Part.from_function_response(
+                        name=function_call["name"],
+                        response={
+                            "content": function_response,
+                        },
+                    )
+                )
             content = Content(
-                parts=[part],
+                parts=parts,
             )
             self.history.append(content)
             model_response = await self.request_model(self.history)
@@ -127,10 +141,15 @@ class UserModel:
             )
 
     def get_prompt(self) -> str:
-        formatter = "%A, %m/%d/%Y, %H:%M:%S"
-        now = datetime.now(timezone("US/Pacific")).strftime("%A, %m/%d/%Y, %H:%M:%S")
-        prompt = f"{PREFIX}\nToday's date and current time is {now}."
-        return prompt
+        global CURRENT_PROMPT
+        # The prompt only shows whole seconds, so build it at most once a second
+        now = int(time.time())
+        if CURRENT_PROMPT[0] != now:
+            current_datetime = datetime.fromtimestamp(now, PACIFIC_TIMEZONE)
+            formatted = current_datetime.strftime(DATETIME_FORMATTER)
+            prompt = f"{PREFIX}\nToday's date and current time is {formatted}."
+            CURRENT_PROMPT = (now, prompt)
+        return CURRENT_PROMPT[1]
 
     def debug_log(self, output: str) -> None:
         if DEBUG:
@@ -151,32 +170,38 @@ class UserModel:
             return f"Booking ticket on {function_params.get('airline')} {function_params.get('flight_number')}"
         return ""
 
+    async def call_function(self, function_call: Dict[str, Any]) -> Any:
+        function_name = function_call.get("name")
+        if function_name in get_confirmation_needing_tools():
+            return self.confirmation_response(function_name, function_call.get("args"))
+        return await self.request_function(function_call)
+
     async def request_function(self, function_call):
         url = function_request(function_call["name"])
         params = function_call["args"]
         self.debug_log(f"Function url is {url}.\nParams is {params}.")
-        response = await self.client.get(
+        async with self.client.get(
             url=f"{BASE_URL}/{url}",
             params=params,
-            headers=get_headers(self.client),
-        )
-        response_json = await response.json()
+            headers=await get_headers(self.user_id_token),
+        ) as response:
+            response_json = await response.json(loads=orjson.loads)
         response_results = response_json.get("results")
         return response_results
 
     async def insert_ticket(self, params: str):
-        return await insert_ticket(self.client, params)
+        return await insert_ticket(self.client, params, self.user_id_token)
 
     def reset_memory(self, model: str):
         """reinitiate chat model to reset memory."""
-        del self.history
-        self.history = []
+        self.history.clear()
 
 
 class FunctionCallingOrchestrator(BaseOrchestrator):
     _user_sessions: Dict[str, UserModel]
     # aiohttp context
     connector = None
+    client: Optional[ClientSession] = None
 
     def __init__(self):
         self._user_sessions = {}
@@ -208,10 +233,12 @@ class FunctionCallingOrchestrator(BaseOrchestrator):
         id = session["uuid"]
         if "history" not in session:
             session["history"] = [BASE_HISTORY]
-        client = await self.create_client_session()
-        model = UserModel.initialize_model(client, self.MODEL)
+        if self.client is None:
+            # Users only differ by their ID token, which is sent per request,
+            # so they all share one session and its connection pool
+            self.client = await self.create_client_session()
+        model = UserModel.initialize_model(self.client, self.MODEL)
         self._user_sessions[id] = model
-        self.client = client
 
     async def user_session_invoke(self, uuid: str, prompt: str) -> dict[str, Any]:
         user_session = self.get_user_session(uuid)
@@ -221,7 +248,6 @@ class FunctionCallingOrchestrator(BaseOrchestrator):
 
     def user_session_reset(self, session: dict[str, Any], uuid: str):
         user_session = self.get_user_session(uuid)
-        del session["history"]
         base_history = self.get_base_history(session)
         session["history"] = [base_history]
         user_session.reset_memory(self.MODEL)
@@ -229,9 +255,17 @@ class FunctionCallingOrchestrator(BaseOrchestrator):
     def get_user_session(self, uuid: str) -> UserModel:
         return self._user_sessions[uuid]
 
+    def set_user_session_header(self, uuid: str, user_id_token: str):
+        self.get_user_session(uuid).user_id_token = user_id_token
+
+    def get_user_id_token(self, uuid: str) -> Optional[str]:
+        if self.user_session_exist(uuid):
+            return self.get_user_session(uuid).user_id_token
+        return None
+
     async def get_connector(self) -> TCPConnector:
         if self.connector is None:
-            self.connector = TCPConnector(limit=100)
+            self.connector = create_connector()
         return self.connector
 
     async def create_client_session(self) -> ClientSession:
@@ -256,14 +290,15 @@ class FunctionCallingOrchestrator(BaseOrchestrator):
     async def user_session_signout(self, uuid: str):
         user_session = self.get_user_session(uuid)
         if user_session:
-            await user_session.close()
             del self._user_sessions[uuid]
 
     async def close_clients(self):
-        close_client_tasks = [
-            asyncio.create_task(a.close()) for a in self._user_sessions.values()
-        ]
-        await asyncio.gather(*close_client_tasks)
+        self._user_sessions.clear()
+        if self.client:
+            await self.client.close()
+        # The session does not own the shared connector, so close it as well
+        if self.connector:
+            await self.connector.close()
 
 
 PREFIX = """The Cymbal Air Customer Service Assistant helps customers of Cymbal Air with their travel needs.
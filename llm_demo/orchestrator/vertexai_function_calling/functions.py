@@ -13,13 +13,13 @@
 # limitations under the License.
 
 import json
-import os
+from typing import Optional
 
 import aiohttp
+import orjson
 from vertexai.preview import generative_models  # type: ignore
 
-BASE_URL = os.getenv("BASE_URL", default="http://127.0.0.1:8080")
-CREDENTIALS = None
+from ..retrieval_client import BASE_URL, get_headers
 
 search_airports_func = generative_models.FunctionDeclaration(
     name="airports_search",
@@ -187,9 +187,11 @@ list_tickets_func = generative_models.FunctionDeclaration(
 )
 
 
-async def insert_ticket(client: aiohttp.ClientSession, params: str):
+async def insert_ticket(
+    client: aiohttp.ClientSession, params: str, user_id_token: Optional[str]
+):
     ticket_info = json.loads(params)
-    response = await client.post(
+    async with client.post(
         url=f"{BASE_URL}/tickets/insert",
         params={
             "airline": ticket_info.get("airline"),
@@ -199,38 +201,10 @@ async def insert_ticket(client: aiohttp.ClientSession, params: str):
             "departure_time": ticket_info.get("departure_time").replace("T", " "),
             "arrival_time": ticket_info.get("arrival_time").replace("T", " "),
         },
-        headers=get_headers(client),
-    )
-    response = await response.json()
-    return response
-
-
-def get_id_token():
-    global CREDENTIALS
-    if CREDENTIALS is None:
-        CREDENTIALS, _ = google.auth.default()
-        if not hasattr(CREDENTIALS, "id_token"):
-            # Use Compute Engine default credential
-            CREDENTIALS = compute_engine.IDTokenCredentials(
-                request=Request(),
-                target_audience=BASE_URL,
-                use_metadata_identity_endpoint=True,
-            )
-    if not CREDENTIALS.valid:
-        CREDENTIALS.refresh(Request())
-    if hasattr(CREDENTIALS, "id_token"):
-        return CREDENTIALS.id_token
-    else:
-        return CREDENTIALS.token
-
-
-def get_headers(client: aiohttp.ClientSession):
-    """Helper method to generate ID tokens for authenticated requests"""
-    headers = client.headers
-    if not "http://" in BASE_URL:
-        # Append ID Token to make authenticated requests to Cloud Run services
-        headers["Authorization"] = f"Bearer {get_id_token()}"
-    return headers
+        headers=await get_headers(user_id_token),
+    ) as response:
+        response_json = await response.json(loads=orjson.loads)
+    return response_json
 
 
 def function_request(function_call_name: str) -> str:
@@ -23,7 +23,7 @@ from google.oauth2.id_token import fetch_id_token
 from evaluation import (
     evaluate_response_phase,
     evaluate_retrieval_phase,
-    goldens,
+    get_goldens,
     run_llm_for_eval,
 )
 from orchestrator import createOrchestrator
@@ -71,7 +71,7 @@ async def main():
     orc.set_user_session_header(session_id, user_id_token)
 
     # Run evaluation
-    eval_lists = await run_llm_for_eval(goldens, orc, session, session_id)
+    eval_lists = await run_llm_for_eval(get_goldens(), orc, session, session_id)
     retrieval_eval_results = evaluate_retrieval_phase(
         eval_lists, RETRIEVAL_EXPERIMENT_NAME
     )
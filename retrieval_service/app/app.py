@@ -18,6 +18,7 @@ from typing import Optional
 
 import yaml
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 from langchain_google_vertexai import VertexAIEmbeddings
 from pydantic import BaseModel
 
@@ -56,4 +57,6 @@ def init_app(cfg: AppConfig) -> FastAPI:
     app = FastAPI(lifespan=gen_init(cfg))
     app.state.client_id = cfg.clientId
     app.include_router(routes)
+    # Compress larger JSON responses (e.g. flight and amenity searches)
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
     return app